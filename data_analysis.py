@@ -1,6 +1,19 @@
-import pandas as pd
-import matplotlib.pyplot as plt
+from bisect import bisect_right
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import os
+import pickle
+
+import numpy as np
+import pandas as pd
+import matplotlib
+from matplotlib.figure import Figure
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Charts are only written to files, so use the non-interactive Agg backend
+matplotlib.use("Agg")
 
 # Comprehensive Healthcare and Claims Analysis
 # Sophia Beebe
@@ -30,132 +43,255 @@ import os
 #
 # Running Instructions:
 # 1. Ensure "insurance.csv" and "claim_data.csv" are in the same directory.
-# 2. Install dependencies: pip install pandas matplotlib
+# 2. Install dependencies: pip install pandas pyarrow matplotlib
 # 3. Run: python data_analysis.py
 #
 # Results are printed to the console, and charts are saved as .png files.
+# A parsed copy of insurance.csv is cached as insurance.parquet and rebuilt whenever
+# the CSV changes; claim_data.csv is streamed in chunks so it never has to fit in
+# memory. Computed results are cached in .cache/ and reused until the CSVs or this
+# script change.
+
+# Low-cardinality text columns are parsed straight to categoricals
+INSURANCE_DTYPES = {"sex": "category", "smoker": "category", "region": "category"}
+CLAIM_DTYPES = {"Insurance Type": "category", "Claim Status": "category"}
+# Only these claim_data.csv columns are used by the analysis, so only these are parsed
+CLAIM_COLUMNS = ["Billed Amount", "Insurance Type", "Claim Status"]
+# Rows of claim_data.csv parsed at a time
+CLAIM_CHUNKSIZE = 1_000_000
+
+# Parquet schema metadata entry recording which CSV contents a Parquet copy came from
+PARQUET_SOURCE_KEY = b"data_analysis_source"
+
+# Computed results are memoized here, keyed by the input CSV (see cached_results)
+CACHE_DIR = ".cache"
+
+BMI_THRESHOLDS = [18.5, 25, 30]
+BMI_BINS = [-np.inf, *BMI_THRESHOLDS, np.inf]
+BMI_LABELS = ["Underweight", "Normal", "Overweight", "Obese"]
 
 def categorize_bmi(bmi):
-    """Categorize BMI into groups: Underweight, Normal, Overweight, Obese."""
-    if bmi < 18.5:
-        return "Underweight"
-    elif bmi < 25:
-        return "Normal"
-    elif bmi < 30:
-        return "Overweight"
-    else:
-        return "Obese"
+    """
+    Categorize a single BMI value into groups: Underweight, Normal, Overweight, Obese.
+    Kept for scalar callers; whole columns are binned with pd.cut using BMI_BINS.
+    """
+    # bisect_right puts a value equal to a threshold in the upper group, like pd.cut(right=False)
+    return BMI_LABELS[bisect_right(BMI_THRESHOLDS, bmi)]
 
-def plot_bar_chart(data, title, xlabel, ylabel, output_filename):
+def category_mask(series, values):
+    """
+    Return a boolean NumPy array marking the entries of series equal to any of values.
+    Categorical columns are compared on their integer codes instead of their strings.
+    """
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        return series.isin(values).to_numpy()
+    categories = series.cat.categories
+    codes = [categories.get_loc(value) for value in values if value in categories]
+    return np.isin(series.cat.codes.to_numpy(), codes)
+
+def plot_bar_chart(ax, data, title, xlabel, ylabel, output_filename):
     """
     Plot a bar chart given a Pandas Series or dictionary-like object.
+    The axes are cleared first so one figure can be reused for every chart.
     """
-    plt.figure(figsize=(8, 5))
-    data.plot(kind='bar', color='skyblue')
-    plt.title(title)
-    plt.xlabel(xlabel)
-    plt.ylabel(ylabel)
-    plt.tight_layout()
-    plt.savefig(output_filename)
-    plt.close()
+    fig = ax.figure
+    ax.clear()
+    data.plot(kind='bar', ax=ax, color='skyblue')
+    ax.set_title(title)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    fig.tight_layout()
+    fig.savefig(output_filename)
     print(f"A bar chart has been saved as {output_filename}.")
 
-def analyze_insurance_data(df):
+def summarize_insurance_data(df):
     """
-    Analyze the insurance dataset:
+    Compute the insurance dataset results:
     A. Average charges for smokers vs non-smokers.
-    B. Highest average charges by region.
-    C. Charges by BMI category.
+    B. Average charges by region.
+    C. Average charges by BMI category.
     """
-    print("=== Insurance Data Analysis ===")
+    # right=False keeps the same boundaries as categorize_bmi (e.g. 18.5 is Normal)
+    df['bmi_category'] = pd.cut(df['bmi'].to_numpy(), bins=BMI_BINS, labels=BMI_LABELS, right=False)
+
+    # One pass over 'charges' for every smoker/region/BMI combination; each average
+    # below is rolled up from these small per-group sums and counts.
+    charge_totals = df.groupby(['smoker', 'region', 'bmi_category'], observed=True)['charges'].agg(['sum', 'count'])
+
+    def average_charges_by(level):
+        totals = charge_totals.groupby(level=level, observed=True).sum()
+        return totals['sum'] / totals['count']
 
     # A. Average charges for smokers vs non-smokers
-    smokers = df[df['smoker'] == 'yes']
-    nonsmokers = df[df['smoker'] == 'no']
-    avg_charges_smokers = smokers['charges'].mean()
-    avg_charges_nonsmokers = nonsmokers['charges'].mean()
+    avg_charges_by_smoker = average_charges_by('smoker')
+
+    # B. Average charges by region
+    # Categorical keys are already ordered by code, so the default sort is free and
+    # keeps the regions listed alphabetically in the output and chart.
+    charges_by_region = average_charges_by('region')
+
+    # C. Charges by BMI category
+    charges_by_bmi = average_charges_by('bmi_category').sort_values()
 
+    return {
+        'avg_charges_smokers': avg_charges_by_smoker.get('yes', np.nan),
+        'avg_charges_nonsmokers': avg_charges_by_smoker.get('no', np.nan),
+        'charges_by_region': charges_by_region,
+        'charges_by_bmi': charges_by_bmi,
+    }
+
+def report_insurance_results(results, ax):
+    """
+    Print the insurance results and save their bar charts.
+    """
+    print("=== Insurance Data Analysis ===")
+
+    # A. Average charges for smokers vs non-smokers
     print("A. Average Charges by Smoking Status")
-    print(f"   Smokers: ${avg_charges_smokers:,.2f}")
-    print(f"   Non-Smokers: ${avg_charges_nonsmokers:,.2f}")
+    print(f"   Smokers: ${results['avg_charges_smokers']:,.2f}")
+    print(f"   Non-Smokers: ${results['avg_charges_nonsmokers']:,.2f}")
     print()
 
     # B. Which region has the highest average medical charges?
-    charges_by_region = df.groupby('region')['charges'].mean()
+    charges_by_region = results['charges_by_region']
     print("B. Average Charges by Region")
     for region, charge in charges_by_region.items():
         print(f"   {region.capitalize()}: ${charge:,.2f}")
 
     highest_region = charges_by_region.idxmax()
-    highest_charges = charges_by_region.max()
+    highest_charges = charges_by_region.loc[highest_region]
     print()
     print(f"   The region with the highest average charges is {highest_region.capitalize()} with ${highest_charges:,.2f}.")
     print()
 
     # Bar chart for charges by region
-    plot_bar_chart(charges_by_region,
+    plot_bar_chart(ax, charges_by_region,
                 title='Average Healthcare Charges by Region',
                 xlabel='Region',
                 ylabel='Average Charges ($)',
                 output_filename='charges_by_region.png')
 
     # C. Charges by BMI category
-    df['bmi_category'] = df['bmi'].apply(categorize_bmi)
-    charges_by_bmi = df.groupby('bmi_category')['charges'].mean().sort_values()
+    charges_by_bmi = results['charges_by_bmi']
     print("C. Average Charges by BMI Category")
     for category, charge in charges_by_bmi.items():
         print(f"   {category}: ${charge:,.2f}")
 
     highest_bmi_cat = charges_by_bmi.idxmax()
-    highest_bmi_charges = charges_by_bmi.max()
+    highest_bmi_charges = charges_by_bmi.loc[highest_bmi_cat]
     print()
     print(f"   The BMI category with the highest average charges is {highest_bmi_cat} with ${highest_bmi_charges:,.2f}.")
     print()
 
     # Bar chart for charges by BMI category
-    plot_bar_chart(charges_by_bmi,
+    plot_bar_chart(ax, charges_by_bmi,
                 title='Average Healthcare Charges by BMI Category',
                 xlabel='BMI Category',
                 ylabel='Average Charges ($)',
                 output_filename='charges_by_bmi_category.png')
 
-def analyze_claim_data(df_claims):
+def merge_moments(moments, values):
+    """
+    Merge the count, mean and M2 (sum of squared deviations from the mean) of values
+    into running moments, using Chan et al.'s parallel update so large values with a
+    small spread keep their precision.
     """
-    Analyze the claims dataset:
+    count, mean, m2 = moments
+    if values.size == 0:
+        return moments
+    values_mean = values.mean()
+    values_m2 = np.square(values - values_mean).sum()
+    total = count + values.size
+    delta = values_mean - mean
+    return (total,
+            mean + delta * values.size / total,
+            m2 + values_m2 + delta ** 2 * count * values.size / total)
+
+def summarize_claim_chunks(chunks):
+    """
+    Compute the claims dataset results from an iterable of DataFrame chunks:
     D. Percentage of denied claims by insurance type (Commercial vs Medicare).
-    E. Check correlation between denial and billed amount, and examine if claims over $200 are more likely to be denied.
+    E. Correlation between denial and billed amount, and denial rates above and below $200.
+    Only running counts and moments are kept between chunks, so memory use does not
+    grow with the size of the file. Every chunk must have the CLAIM_COLUMNS.
     """
-    print("=== Claims Data Analysis ===")
+    # D. Claims and denied claims per insurance type (Commercial vs Medicare)
+    totals_by_type = Counter()
+    denied_by_type = Counter()
+    # E. Running count, mean and M2 of Billed Amount overall, for denied claims and for
+    # the rest, plus the denial counts split at $200
+    billed_moments = denied_moments = not_denied_moments = (0, 0.0, 0.0)
+    n_high = n_denied_high = n_low = n_denied_low = 0
+
+    for chunk in chunks:
+        # Rows with no missing values in key columns
+        valid = chunk[CLAIM_COLUMNS].notna().all(axis=1).to_numpy()
+        # True if Claim Status is 'Denied', else False
+        denied_all = category_mask(chunk['Claim Status'], ['Denied'])
+
+        # D. Filter for only Commercial and Medicare claims
+        insurance_type = chunk['Insurance Type']
+        is_commercial_or_medicare = valid & category_mask(insurance_type, ['Commercial', 'Medicare'])
+        totals_by_type.update(insurance_type[is_commercial_or_medicare].value_counts().to_dict())
+        denied_by_type.update(insurance_type[is_commercial_or_medicare & denied_all].value_counts().to_dict())
+
+        # E. Billed amounts and denial flags of the usable rows
+        billed = chunk['Billed Amount'].to_numpy(dtype=float)[valid]
+        denied = denied_all[valid]
+        high_billed = billed > 200
+
+        billed_moments = merge_moments(billed_moments, billed)
+        denied_moments = merge_moments(denied_moments, billed[denied])
+        not_denied_moments = merge_moments(not_denied_moments, billed[~denied])
+        n_high += int(high_billed.sum())
+        n_denied_high += int((denied & high_billed).sum())
+        n_low += int((~high_billed).sum())
+        n_denied_low += int((denied & ~high_billed).sum())
+
+    # Calculate percentages (0% if no claim of that type was denied); value_counts on a
+    # categorical also reports unused categories, so keep only types that were seen
+    insurance_types = sorted(itype for itype, total in totals_by_type.items() if total > 0)
+    denied_percentage = pd.Series(
+        [denied_by_type[itype] / totals_by_type[itype] * 100 for itype in insurance_types],
+        index=pd.Index(insurance_types, name='Insurance Type'),
+        dtype=float,
+    )
 
-    # Expected columns
-    expected_cols = {
-        'Claim ID', 'Provider ID', 'Patient ID', 'Date of Service', 'Billed Amount',
-        'Procedure Code', 'Diagnosis Code', 'Allowed Amount', 'Paid Amount',
-        'Insurance Type', 'Claim Status', 'Reason Code', 'Follow-up Required',
-        'AR Status', 'Outcome'
+    # Compute correlation
+    # Pearson correlation with a binary variable is the point-biserial correlation:
+    # r = (mean billed when denied - mean billed otherwise) * sqrt(p * (1 - p)) / std(billed)
+    n_claims, _, m2_billed = billed_moments
+    n_denied, mean_denied, _ = denied_moments
+    _, mean_not_denied, _ = not_denied_moments
+    std_billed = np.sqrt(m2_billed / n_claims) if n_claims else 0.0
+    if 0 < n_denied < n_claims and std_billed > 0:
+        p_denied = n_denied / n_claims
+        correlation = (mean_denied - mean_not_denied) * np.sqrt(p_denied * (1 - p_denied)) / std_billed
+    else:
+        correlation = np.nan
+
+    # Check proportion of denied claims above and below or equal to $200
+    return {
+        'denied_percentage': denied_percentage,
+        'correlation': correlation,
+        'denied_high': n_denied_high / n_high * 100 if n_high else 0.0,  # percentage denied when > 200
+        'denied_low': n_denied_low / n_low * 100 if n_low else 0.0,  # percentage denied when <= 200
     }
-    if not expected_cols.issubset(df_claims.columns):
-        print("Warning: 'claim_data.csv' does not have all the expected columns. Adjust the code accordingly.")
-    # We'll proceed assuming essential columns are present.
 
-    # Drop any missing values in key columns
-    df_claims = df_claims.dropna(subset=['Insurance Type', 'Claim Status', 'Billed Amount'])
+def report_claim_results(results, ax):
+    """
+    Print the claims results and save the denied claims bar chart.
+    """
+    print("=== Claims Data Analysis ===")
 
     # D. Percentage of denied claims by insurance type (Commercial vs Medicare)
-    # Filter for only Commercial and Medicare claims
-    df_filtered = df_claims[df_claims['Insurance Type'].isin(['Commercial', 'Medicare'])]
-    total_by_type = df_filtered.groupby('Insurance Type')['Claim ID'].count()
-    denied_by_type = df_filtered[df_filtered['Claim Status'] == 'Denied'].groupby('Insurance Type')['Claim ID'].count()
-
-    # Calculate percentages
-    denied_percentage = (denied_by_type / total_by_type * 100).fillna(0)
-
+    denied_percentage = results['denied_percentage']
     print("D. Percentage of Denied Claims by Insurance Type")
     for itype, pct in denied_percentage.items():
         print(f"   {itype}: {pct:.2f}% denied")
 
     # Bar chart for denied claims percentage by insurance type
-    plot_bar_chart(denied_percentage,
+    plot_bar_chart(ax, denied_percentage,
                 title='Percentage of Denied Claims by Insurance Type',
                 xlabel='Insurance Type',
                 ylabel='Percentage Denied (%)',
@@ -164,66 +300,181 @@ def analyze_claim_data(df_claims):
     print()
 
     # E. Correlation between denial claim status and billed amount
-    # Create a binary column: Denied = 1 if Claim Status is 'Denied', else 0
-    df_claims['Denied'] = (df_claims['Claim Status'] == 'Denied').astype(int)
-
-    # Compute correlation
     # If correlation is positive, higher billed amounts might be associated with more denials
     # If negative, higher billed amounts might be associated with fewer denials
     # If near zero, little linear relationship.
-    correlation = df_claims['Denied'].corr(df_claims['Billed Amount'])
-
     print("E. Correlation between Denial Status and Billed Amount")
-    print(f"   Pearson correlation: {correlation:.4f}")
+    print(f"   Pearson correlation: {results['correlation']:.4f}")
     print("   (A positive correlation means as Billed Amount increases, denial likelihood tends to increase.)")
     print()
 
-    # Check proportion of denied claims above and below or equal to $200
-    high_billed = df_claims['Billed Amount'] > 200
-    denied_high = df_claims[high_billed]['Denied'].mean() * 100  # percentage denied when > 200
-    denied_low = df_claims[~high_billed]['Denied'].mean() * 100  # percentage denied when <= 200
-
-    print("   Percentage of denied claims when Billed Amount > $200: {:.2f}%".format(denied_high))
-    print("   Percentage of denied claims when Billed Amount <= $200: {:.2f}%".format(denied_low))
+    print("   Percentage of denied claims when Billed Amount > $200: {:.2f}%".format(results['denied_high']))
+    print("   Percentage of denied claims when Billed Amount <= $200: {:.2f}%".format(results['denied_low']))
     print()
 
-def main():
-    # Check for datasets
-    if not os.path.exists("insurance.csv"):
-        print("Error: 'insurance.csv' file not found.")
-        return
+class DataLoadError(Exception):
+    """A dataset could not be loaded or validated; the message is shown to the user."""
 
-    if not os.path.exists("claim_data.csv"):
-        print("Error: 'claim_data.csv' file not found.")
-        return
+def file_key(path):
+    """
+    Identify the current contents of a file by its absolute path, exact size and
+    modification time in nanoseconds.
+    """
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
 
+def load_csv(csv_path, messages, **read_csv_kwargs):
+    """
+    Load a CSV file through a Parquet copy saved next to it.
+    The Parquet copy stores the CSV's file_key and the read_csv arguments it was parsed
+    with, and is only reused when both match exactly; otherwise it is rewritten.
+    Warnings are appended to messages instead of printed.
+    """
+    parquet_path = os.path.splitext(csv_path)[0] + ".parquet"
+    source_key = f"{file_key(csv_path)}|{sorted(read_csv_kwargs.items())!r}".encode()
+    if os.path.exists(parquet_path):
+        try:
+            metadata = pq.read_schema(parquet_path).metadata or {}
+        except (OSError, pa.ArrowException):
+            metadata = {}  # Unreadable copy; rebuild it below
+        if metadata.get(PARQUET_SOURCE_KEY) == source_key:
+            return pd.read_parquet(parquet_path)
+
+    df = pd.read_csv(csv_path, engine="pyarrow", **read_csv_kwargs)
+    try:
+        table = pa.Table.from_pandas(df)
+        table = table.replace_schema_metadata({**table.schema.metadata, PARQUET_SOURCE_KEY: source_key})
+        # Write next to the target and swap it in, so readers never see a partial file
+        tmp_path = f"{parquet_path}.{os.getpid()}.tmp"
+        try:
+            pq.write_table(table, tmp_path, compression="zstd")
+            os.replace(tmp_path, parquet_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    except OSError as e:
+        # The cache is only an optimization; keep going with the parsed CSV
+        messages.append(f"Warning: could not write {parquet_path}: {e}")
+    return df
+
+def cached_results(csv_path, compute):
+    """
+    Return (compute(messages), messages), with the results memoized as a pickle in
+    CACHE_DIR. The cache key covers the file_key of the CSV and of this script plus the
+    pandas and NumPy versions, so changing any of them recomputes the results.
+    Warnings are collected in messages so the caller decides when to print them.
+    """
+    messages = []
+    key_parts = [file_key(csv_path), file_key(__file__), pd.__version__, np.__version__]
+    key = hashlib.blake2b("|".join(key_parts).encode(), digest_size=16).hexdigest()
+    cache_path = os.path.join(CACHE_DIR, f"{key}.pkl")
+
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, "rb") as f:
+                return pickle.load(f), messages
+        except Exception:
+            pass  # Unreadable or incompatible cache entry; recompute it below
+
+    results = compute(messages)
+    # Write next to the target and swap it in, so an interrupted run or two runs at
+    # once never leave a half-written entry
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump(results, f)
+            os.replace(tmp_path, cache_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    except OSError as e:
+        # The cache is only an optimization; keep going with the computed results
+        messages.append(f"Warning: could not write {cache_path}: {e}")
+    return results, messages
+
+def load_insurance_results(messages):
+    """
+    Load insurance.csv and compute its results.
+    Raises DataLoadError if the file cannot be used; warnings are appended to messages.
+    """
     # Load insurance data
     try:
-        df_insurance = pd.read_csv("insurance.csv")
+        df_insurance = load_csv("insurance.csv", messages, dtype=INSURANCE_DTYPES)
     except Exception as e:
-        print(f"Error loading insurance.csv: {e}")
-        return
+        raise DataLoadError(f"Error loading insurance.csv: {e}") from e
 
     # Validate insurance data columns
     expected_insurance_cols = {"age", "sex", "bmi", "children", "smoker", "region", "charges"}
     if not expected_insurance_cols.issubset(df_insurance.columns):
-        print("Error: The insurance dataset does not have the expected columns.")
-        return
+        raise DataLoadError("Error: The insurance dataset does not have the expected columns.")
 
     df_insurance = df_insurance.dropna()
+    return summarize_insurance_data(df_insurance)
 
-    # Analyze insurance data
-    analyze_insurance_data(df_insurance)
-
-    # Load claim data
+def load_claim_results(messages):
+    """
+    Load claim_data.csv and compute its results.
+    Raises DataLoadError if the file cannot be used; messages is accepted for
+    cached_results, as streaming the claims has no warnings to report.
+    """
     try:
-        df_claims = pd.read_csv("claim_data.csv")
+        # Validate the header once, before streaming, so a missing column is reported
+        # by name instead of through read_csv's usecols error
+        header = pd.read_csv("claim_data.csv", nrows=0).columns
+        missing_cols = [col for col in CLAIM_COLUMNS if col not in header]
+        if missing_cols:
+            raise ValueError(f"claims data is missing required columns: {', '.join(missing_cols)}")
+
+        # Stream claim data in chunks; parse errors surface while iterating
+        with pd.read_csv("claim_data.csv", usecols=CLAIM_COLUMNS, dtype=CLAIM_DTYPES,
+                         chunksize=CLAIM_CHUNKSIZE) as chunks:
+            return summarize_claim_chunks(chunks)
     except Exception as e:
-        print(f"Error loading claim_data.csv: {e}")
+        raise DataLoadError(f"Error loading claim_data.csv: {e}") from e
+
+def main():
+    # Check for datasets
+    if not os.path.exists("insurance.csv"):
+        print("Error: 'insurance.csv' file not found.")
         return
 
-    # Analyze claim data
-    analyze_claim_data(df_claims)
+    if not os.path.exists("claim_data.csv"):
+        print("Error: 'claim_data.csv' file not found.")
+        return
+
+    # Results are reused from CACHE_DIR when neither the CSV nor this script changed
+    try:
+        insurance_results, messages = cached_results("insurance.csv", load_insurance_results)
+    except DataLoadError as e:
+        print(e)
+        return
+    for message in messages:
+        print(message)
+
+    # The claims data is independent, so compute it in the background while the
+    # insurance results are printed and plotted. Workers never print; their errors and
+    # warnings are shown here, in report order.
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        claim_future = executor.submit(cached_results, "claim_data.csv", load_claim_results)
+
+        # One figure is shared by all of the bar charts
+        ax = Figure(figsize=(8, 5)).subplots()
+
+        # Analyze insurance data
+        report_insurance_results(insurance_results, ax)
+
+        try:
+            claim_results, messages = claim_future.result()
+        except DataLoadError as e:
+            print(e)
+            return
+        for message in messages:
+            print(message)
+
+        # Analyze claim data
+        report_claim_results(claim_results, ax)
 
     print("Analysis complete.")
 